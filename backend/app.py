@@ -1,420 +1,450 @@
-from flask import Flask, request, jsonify
+import hashlib
+import threading
+from collections import OrderedDict
+import orjson
+from flask import Blueprint, Flask, Response, g, request, jsonify
 from flask_jwt_extended import (
     JWTManager,
     create_access_token,
     jwt_required,
     get_jwt_identity,
+    verify_jwt_in_request,
 )
 from flask_cors import CORS
+from flask_orjson import OrjsonProvider
+from werkzeug.exceptions import HTTPException
 from config import Config
-from storage import UserStorage, DataItemStorage, CredentialStorage
+from models import db
+from storage import init_storage, UserStorage, DataItemStorage, CredentialStorage
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)  # Rust-backed JSON encoding for jsonify()
 app.config.from_object(Config)
 
 # Initialize extensions
+db.init_app(app)
 jwt = JWTManager(app)
 CORS(app)  # Enable CORS for frontend integration
 
+# Route groups, registered on the app once all routes are defined
+auth_bp = Blueprint("auth", __name__, url_prefix="/api/auth")
+data_bp = Blueprint("data", __name__, url_prefix="/api/data")
+cred_bp = Blueprint("cred", __name__, url_prefix="/api/credentials")
+
+
+@data_bp.before_request
+@cred_bp.before_request
+def load_current_user_id():
+    """Verify the JWT once per request and keep the caller's ID on g"""
+    # CORS preflight (OPTIONS) is exempt and carries no token
+    if verify_jwt_in_request():
+        g.user_id = get_jwt_identity()
+
+
+def json_response(obj, status=200):
+    """Serialize obj with orjson straight into a Response"""
+    return Response(orjson.dumps(obj), status=status, mimetype="application/json")
+
+
+# Serialized list responses keyed by (collection, user_id), least recently used
+# first. An entry is reused until the collection's version (row count, latest
+# updated_at) changes. That relies on the wall clock never moving backwards:
+# an update stamped earlier than the current max(updated_at) leaves the
+# version unchanged, so the stale body and ETag keep being served.
+# The size is bounded so each worker only keeps credentials for recently
+# active users in memory.
+LIST_CACHE_SIZE = 256
+_list_cache = OrderedDict()
+_list_cache_lock = threading.Lock()
+
+
+def cached_list_response(name, storage, user_id):
+    """Return a user's collection with an ETag, or 304 if the client is current"""
+    key = (name, user_id)
+    version = storage.get_version(user_id)
+    with _list_cache_lock:
+        cached = _list_cache.get(key)
+        if cached is not None:
+            _list_cache.move_to_end(key)
+
+    if cached is None or cached[0] != version:
+        # Rows are selected straight into API-shaped dicts; orjson writes the
+        # timestamps in the same ISO 8601 form as the models' to_dict()
+        body = orjson.dumps({name: storage.get_all_dicts(user_id)})
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        cached = (version, etag, body)
+        with _list_cache_lock:
+            _list_cache[key] = cached
+            _list_cache.move_to_end(key)
+            while len(_list_cache) > LIST_CACHE_SIZE:
+                _list_cache.popitem(last=False)
+
+    _, etag, body = cached
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(body, status=200, mimetype="application/json")
+    response.set_etag(etag)
+    return response
+
 
 # ==================== Authentication Routes ====================
 
 
-@app.route("/api/auth/register", methods=["POST"])
+@auth_bp.route("/register", methods=["POST"])
 def register():
     """Register a new user"""
-    try:
-        data = request.get_json()
+    data = request.get_json(silent=True)
 
-        if not data:
-            return jsonify({"error": "No data provided"}), 400
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
 
-        username = data.get("username")
-        password = data.get("password")
+    username = data.get("username")
+    password = data.get("password")
 
-        # Validation
-        if not username or not password:
-            return jsonify({"error": "Username and password are required"}), 400
+    # Validation
+    if not username or not password:
+        return jsonify({"error": "Username and password are required"}), 400
 
-        if len(username) < 3:
-            return jsonify({"error": "Username must be at least 3 characters"}), 400
+    if len(username) < 3:
+        return jsonify({"error": "Username must be at least 3 characters"}), 400
 
-        if len(password) < 6:
-            return jsonify({"error": "Password must be at least 6 characters"}), 400
+    if len(password) < 6:
+        return jsonify({"error": "Password must be at least 6 characters"}), 400
 
-        # Check if user already exists
-        if UserStorage.get_by_username(username):
-            return jsonify({"error": "Username already exists"}), 400
-
-        # Create new user
+    # Create new user; fails with ValueError if the username is taken
+    try:
         user = UserStorage.create(username, password)
-
-        # Generate access token
-        access_token = create_access_token(identity=user["id"])
-
-        return (
-            jsonify(
-                {
-                    "message": "User registered successfully",
-                    "user": UserStorage.to_dict(user),
-                    "access_token": access_token,
-                }
-            ),
-            201,
-        )
-
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
 
+    # Generate access token
+    access_token = create_access_token(identity=user.id)
+
+    return (
+        jsonify(
+            {
+                "message": "User registered successfully",
+                "user": UserStorage.to_dict(user),
+                "access_token": access_token,
+            }
+        ),
+        201,
+    )
 
-@app.route("/api/auth/login", methods=["POST"])
+
+@auth_bp.route("/login", methods=["POST"])
 def login():
     """Login user and return JWT token"""
-    try:
-        data = request.get_json()
+    data = request.get_json(silent=True)
 
-        if not data:
-            return jsonify({"error": "No data provided"}), 400
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
 
-        username = data.get("username")
-        password = data.get("password")
+    username = data.get("username")
+    password = data.get("password")
 
-        if not username or not password:
-            return jsonify({"error": "Username and password are required"}), 400
+    if not username or not password:
+        return jsonify({"error": "Username and password are required"}), 400
 
-        # Find user by username
-        user = UserStorage.get_by_username(username)
+    # Find user by username
+    user = UserStorage.get_by_username(username)
 
-        if not user or not UserStorage.verify_password(user, password):
-            return jsonify({"error": "Invalid username or password"}), 401
+    if not user or not UserStorage.verify_password(user, password):
+        return jsonify({"error": "Invalid username or password"}), 401
 
-        # Generate access token
-        access_token = create_access_token(identity=user["id"])
+    # Generate access token
+    access_token = create_access_token(identity=user.id)
 
-        return (
-            jsonify(
-                {
-                    "message": "Login successful",
-                    "user": UserStorage.to_dict(user),
-                    "access_token": access_token,
-                }
-            ),
-            200,
-        )
+    return (
+        jsonify(
+            {
+                "message": "Login successful",
+                "user": UserStorage.to_dict(user),
+                "access_token": access_token,
+            }
+        ),
+        200,
+    )
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
 
-
-@app.route("/api/auth/me", methods=["GET"])
+@auth_bp.route("/me", methods=["GET"])
 @jwt_required()
 def get_current_user():
     """Get current authenticated user"""
-    try:
-        user_id = get_jwt_identity()
-        user = UserStorage.get_by_id(user_id)
+    user_id = get_jwt_identity()
+    user = UserStorage.get_by_id(user_id)
 
-        if not user:
-            return jsonify({"error": "User not found"}), 404
+    if not user:
+        return jsonify({"error": "User not found"}), 404
 
-        return jsonify({"user": UserStorage.to_dict(user)}), 200
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return json_response({"user": UserStorage.to_dict(user)})
 
 
 # ==================== Data Storage Routes ====================
 
 
-@app.route("/api/data", methods=["GET"])
-@jwt_required()
+@data_bp.route("", methods=["GET"])
 def get_data_items():
     """Get all data items for the current user"""
-    try:
-        user_id = get_jwt_identity()
-        data_items = DataItemStorage.get_all(user_id)
-
-        return (
-            jsonify(
-                {"data_items": [DataItemStorage.to_dict(item) for item in data_items]}
-            ),
-            200,
-        )
+    user_id = g.user_id
+    return cached_list_response("data_items", DataItemStorage, user_id)
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
 
-
-@app.route("/api/data", methods=["POST"])
-@jwt_required()
+@data_bp.route("", methods=["POST"])
 def create_data_item():
     """Create a new data item"""
-    try:
-        user_id = get_jwt_identity()
-        data = request.get_json()
-
-        if not data:
-            return jsonify({"error": "No data provided"}), 400
-
-        title = data.get("title")
-        if not title:
-            return jsonify({"error": "Title is required"}), 400
-
-        data_item = DataItemStorage.create(
-            user_id=user_id,
-            title=title,
-            content=data.get("content"),
-            data_type=data.get("data_type"),
-            metadata=data.get("metadata"),
-        )
-
-        return (
-            jsonify(
-                {
-                    "message": "Data item created successfully",
-                    "data_item": DataItemStorage.to_dict(data_item),
-                }
-            ),
-            201,
-        )
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-
-@app.route("/api/data/<int:item_id>", methods=["GET"])
-@jwt_required()
+    user_id = g.user_id
+    data = request.get_json(silent=True)
+
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+
+    title = data.get("title")
+    if not title or not isinstance(title, str):
+        return jsonify({"error": "Title is required"}), 400
+
+    data_item = DataItemStorage.create(
+        user_id=user_id,
+        title=title,
+        content=data.get("content"),
+        data_type=data.get("data_type"),
+        metadata=data.get("metadata"),
+    )
+
+    return (
+        jsonify(
+            {
+                "message": "Data item created successfully",
+                "data_item": DataItemStorage.to_dict(data_item),
+            }
+        ),
+        201,
+    )
+
+
+@data_bp.route("/<int:item_id>", methods=["GET"])
 def get_data_item(item_id):
     """Get a specific data item"""
-    try:
-        user_id = get_jwt_identity()
-        data_item = DataItemStorage.get_by_id(item_id, user_id)
-
-        if not data_item:
-            return jsonify({"error": "Data item not found"}), 404
+    user_id = g.user_id
+    data_item = DataItemStorage.get_by_id(item_id, user_id)
 
-        return jsonify({"data_item": DataItemStorage.to_dict(data_item)}), 200
+    if not data_item:
+        return jsonify({"error": "Data item not found"}), 404
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return json_response({"data_item": DataItemStorage.to_dict(data_item)})
 
 
-@app.route("/api/data/<int:item_id>", methods=["PUT"])
-@jwt_required()
+@data_bp.route("/<int:item_id>", methods=["PUT"])
 def update_data_item(item_id):
     """Update a data item"""
-    try:
-        user_id = get_jwt_identity()
-        data = request.get_json()
-        if not data:
-            return jsonify({"error": "No data provided"}), 400
-
-        update_data = {}
-        if "title" in data:
-            update_data["title"] = data["title"]
-        if "content" in data:
-            update_data["content"] = data["content"]
-        if "data_type" in data:
-            update_data["data_type"] = data["data_type"]
-        if "metadata" in data:
-            update_data["metadata"] = data["metadata"]
-
-        data_item = DataItemStorage.update(item_id, user_id, **update_data)
-
-        if not data_item:
-            return jsonify({"error": "Data item not found"}), 404
-
-        return (
-            jsonify(
-                {
-                    "message": "Data item updated successfully",
-                    "data_item": DataItemStorage.to_dict(data_item),
-                }
-            ),
-            200,
-        )
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-
-@app.route("/api/data/<int:item_id>", methods=["DELETE"])
-@jwt_required()
+    user_id = g.user_id
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+
+    update_data = {}
+    if "title" in data:
+        # title is NOT NULL in the database, so it can't be cleared
+        if not data["title"] or not isinstance(data["title"], str):
+            return jsonify({"error": "Title is required"}), 400
+        update_data["title"] = data["title"]
+    if "content" in data:
+        update_data["content"] = data["content"]
+    if "data_type" in data:
+        update_data["data_type"] = data["data_type"]
+    if "metadata" in data:
+        update_data["metadata"] = data["metadata"]
+
+    data_item = DataItemStorage.update(item_id, user_id, **update_data)
+
+    if not data_item:
+        return jsonify({"error": "Data item not found"}), 404
+
+    return (
+        jsonify(
+            {
+                "message": "Data item updated successfully",
+                "data_item": DataItemStorage.to_dict(data_item),
+            }
+        ),
+        200,
+    )
+
+
+@data_bp.route("/<int:item_id>", methods=["DELETE"])
 def delete_data_item(item_id):
     """Delete a data item"""
-    try:
-        user_id = get_jwt_identity()
-        data_item = DataItemStorage.get_by_id(item_id, user_id)
+    user_id = g.user_id
+    if not DataItemStorage.delete(item_id, user_id):
+        return jsonify({"error": "Data item not found"}), 404
 
-        if not data_item:
-            return jsonify({"error": "Data item not found"}), 404
-
-        DataItemStorage.delete(item_id, user_id)
-
-        return jsonify({"message": "Data item deleted successfully"}), 200
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return jsonify({"message": "Data item deleted successfully"}), 200
 
 
 # ==================== Credential Management Routes ====================
 
 
-@app.route("/api/credentials", methods=["GET"])
-@jwt_required()
+@cred_bp.route("", methods=["GET"])
 def get_credentials():
     """Get all credentials for the current user"""
-    try:
-        user_id = get_jwt_identity()
-        credentials = CredentialStorage.get_all(user_id)
-
-        return (
-            jsonify(
-                {
-                    "credentials": [
-                        CredentialStorage.to_dict(cred) for cred in credentials
-                    ]
-                }
-            ),
-            200,
-        )
+    user_id = g.user_id
+    return cached_list_response("credentials", CredentialStorage, user_id)
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
 
-
-@app.route("/api/credentials", methods=["POST"])
-@jwt_required()
+@cred_bp.route("", methods=["POST"])
 def create_credential():
     """Create a new credential"""
-    try:
-        user_id = get_jwt_identity()
-        data = request.get_json()
-
-        if not data:
-            return jsonify({"error": "No data provided"}), 400
-
-        service_name = data.get("service_name")
-        if not service_name:
-            return jsonify({"error": "Service name is required"}), 400
-
-        credential = CredentialStorage.create(
-            user_id=user_id,
-            service_name=service_name,
-            username=data.get("username"),
-            email=data.get("email"),
-            password=data.get("password"),  # In production, encrypt this
-            api_key=data.get("api_key"),  # In production, encrypt this
-            notes=data.get("notes"),
-        )
-
-        return (
-            jsonify(
-                {
-                    "message": "Credential created successfully",
-                    "credential": CredentialStorage.to_dict(credential),
-                }
-            ),
-            201,
-        )
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-
-@app.route("/api/credentials/<int:credential_id>", methods=["GET"])
-@jwt_required()
+    user_id = g.user_id
+    data = request.get_json(silent=True)
+
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+
+    service_name = data.get("service_name")
+    if not service_name or not isinstance(service_name, str):
+        return jsonify({"error": "Service name is required"}), 400
+
+    credential = CredentialStorage.create(
+        user_id=user_id,
+        service_name=service_name,
+        username=data.get("username"),
+        email=data.get("email"),
+        password=data.get("password"),  # In production, encrypt this
+        api_key=data.get("api_key"),  # In production, encrypt this
+        notes=data.get("notes"),
+    )
+
+    return (
+        jsonify(
+            {
+                "message": "Credential created successfully",
+                "credential": CredentialStorage.to_dict(credential),
+            }
+        ),
+        201,
+    )
+
+
+@cred_bp.route("/<int:credential_id>", methods=["GET"])
 def get_credential(credential_id):
     """Get a specific credential"""
-    try:
-        user_id = get_jwt_identity()
-        credential = CredentialStorage.get_by_id(credential_id, user_id)
-
-        if not credential:
-            return jsonify({"error": "Credential not found"}), 404
+    user_id = g.user_id
+    credential = CredentialStorage.get_by_id(credential_id, user_id)
 
-        return jsonify({"credential": CredentialStorage.to_dict(credential)}), 200
+    if not credential:
+        return jsonify({"error": "Credential not found"}), 404
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return json_response({"credential": CredentialStorage.to_dict(credential)})
 
 
-@app.route("/api/credentials/<int:credential_id>", methods=["PUT"])
-@jwt_required()
+@cred_bp.route("/<int:credential_id>", methods=["PUT"])
 def update_credential(credential_id):
     """Update a credential"""
-    try:
-        user_id = get_jwt_identity()
-        data = request.get_json()
-        if not data:
-            return jsonify({"error": "No data provided"}), 400
-
-        update_data = {}
-        if "service_name" in data:
-            update_data["service_name"] = data["service_name"]
-        if "username" in data:
-            update_data["username"] = data["username"]
-        if "email" in data:
-            update_data["email"] = data["email"]
-        if "password" in data:
-            update_data["password"] = data["password"]  # In production, encrypt this
-        if "api_key" in data:
-            update_data["api_key"] = data["api_key"]  # In production, encrypt this
-        if "notes" in data:
-            update_data["notes"] = data["notes"]
-
-        credential = CredentialStorage.update(credential_id, user_id, **update_data)
-
-        if not credential:
-            return jsonify({"error": "Credential not found"}), 404
-
-        return (
-            jsonify(
-                {
-                    "message": "Credential updated successfully",
-                    "credential": CredentialStorage.to_dict(credential),
-                }
-            ),
-            200,
-        )
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-
-@app.route("/api/credentials/<int:credential_id>", methods=["DELETE"])
-@jwt_required()
+    user_id = g.user_id
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+
+    update_data = {}
+    if "service_name" in data:
+        # service_name is NOT NULL in the database, so it can't be cleared
+        if not data["service_name"] or not isinstance(data["service_name"], str):
+            return jsonify({"error": "Service name is required"}), 400
+        update_data["service_name"] = data["service_name"]
+    if "username" in data:
+        update_data["username"] = data["username"]
+    if "email" in data:
+        update_data["email"] = data["email"]
+    if "password" in data:
+        update_data["password"] = data["password"]  # In production, encrypt this
+    if "api_key" in data:
+        update_data["api_key"] = data["api_key"]  # In production, encrypt this
+    if "notes" in data:
+        update_data["notes"] = data["notes"]
+
+    credential = CredentialStorage.update(credential_id, user_id, **update_data)
+
+    if not credential:
+        return jsonify({"error": "Credential not found"}), 404
+
+    return (
+        jsonify(
+            {
+                "message": "Credential updated successfully",
+                "credential": CredentialStorage.to_dict(credential),
+            }
+        ),
+        200,
+    )
+
+
+@cred_bp.route("/<int:credential_id>", methods=["DELETE"])
 def delete_credential(credential_id):
     """Delete a credential"""
-    try:
-        user_id = get_jwt_identity()
-        credential = CredentialStorage.get_by_id(credential_id, user_id)
+    user_id = g.user_id
+    if not CredentialStorage.delete(credential_id, user_id):
+        return jsonify({"error": "Credential not found"}), 404
+
+    return jsonify({"message": "Credential deleted successfully"}), 200
 
-        if not credential:
-            return jsonify({"error": "Credential not found"}), 404
 
-        CredentialStorage.delete(credential_id, user_id)
+# ==================== Error Handlers ====================
 
-        return jsonify({"message": "Credential deleted successfully"}), 200
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+@app.errorhandler(Exception)
+def handle_exception(e):
+    """Return unhandled errors as JSON instead of per-route try/except"""
+    if isinstance(e, HTTPException):
+        # Keep the exception's own headers (Allow on 405, WWW-Authenticate, ...)
+        response = e.get_response()
+        response.data = orjson.dumps({"error": str(e)})
+        response.content_type = "application/json"
+        return response
+    return jsonify({"error": str(e)}), 500
 
 
 # ==================== Health Check ====================
 
+# The payload never changes, so encode it once. A fresh Response is still built
+# per request because after_request hooks (CORS) add headers to it.
+HEALTH_BODY = orjson.dumps({"status": "healthy", "message": "API is running"})
+
 
 @app.route("/api/health", methods=["GET"])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "message": "API is running"}), 200
+    return Response(HEALTH_BODY, status=200, mimetype="application/json")
+
+
+# ==================== Register Blueprints ====================
+
+app.register_blueprint(auth_bp)
+app.register_blueprint(data_bp)
+app.register_blueprint(cred_bp)
 
 
 # ==================== Initialize Storage ====================
 
-# JSON storage is initialized automatically when storage.py is imported
+# Schema setup and the legacy JSON import must run once per start, not once
+# per gunicorn worker: the Docker image runs `flask --app app init-db` before
+# starting gunicorn, and the dev server runs it below.
+
+
+def setup_storage():
+    """Create tables and import legacy JSON data"""
+    with app.app_context():
+        init_storage()
+        # Close the setup connections; requests open their own
+        db.engine.dispose()
+
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Create tables and import legacy JSON data"""
+    setup_storage()
+
 
 if __name__ == "__main__":
+    setup_storage()
     app.run(debug=True, host="0.0.0.0", port=5001)
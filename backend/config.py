@@ -1,11 +1,20 @@
 import os
 from datetime import timedelta
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
 
 class Config:
     """Application configuration"""
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///app.db'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or f"sqlite:///{BASE_DIR / 'data' / 'app.db'}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Let the SQLite connection pool hand connections across gunicorn threads
+    SQLALCHEMY_ENGINE_OPTIONS = (
+        {'connect_args': {'check_same_thread': False}}
+        if SQLALCHEMY_DATABASE_URI.startswith('sqlite') else {}
+    )
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-key-change-in-production'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
     JWT_ALGORITHM = 'HS256'
+    JWT_DECODE_ALGORITHMS = ['HS256']  # Only accept the algorithm tokens are signed with
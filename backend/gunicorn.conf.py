@@ -6,9 +6,12 @@ bind = "0.0.0.0:5001"
 backlog = 2048
 
 # Worker processes
+# Requests spend their time waiting on SQLite or in argon2 hashing, both of
+# which release the GIL, so each process serves several requests at once
+# with threads. gevent is avoided because sqlite3 calls would block its hub.
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
-worker_connections = 1000
+worker_class = "gthread"
+threads = 4
 timeout = 120
 keepalive = 5
 
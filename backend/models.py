@@ -1,8 +1,42 @@
+import sqlite3
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.security import check_password_hash
 from datetime import datetime
 
-db = SQLAlchemy()
+# Keep attribute values after commit so returning a freshly created or
+# updated record doesn't reload the row it just wrote
+db = SQLAlchemy(session_options={'expire_on_commit': False})
+
+# Argon2id with OWASP's baseline parameters (19 MiB, 2 passes), ~35ms per hash.
+# Hashes created with werkzeug before the switch are still accepted.
+password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+def password_hash_needs_rehash(password_hash):
+    """Check if a stored hash predates the current algorithm or parameters"""
+    if not password_hash.startswith('$argon2'):
+        return True
+    return password_hasher.check_needs_rehash(password_hash)
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragma(dbapi_connection, connection_record):
+    """Enable WAL journaling and keep hot pages in memory between requests"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        # Writes append to the WAL and are checkpointed into the main file
+        # every 1000 pages; truncate the WAL back to 16 MiB after each checkpoint
+        cursor.execute('PRAGMA journal_size_limit=16777216')
+        # 8 MiB page cache per connection, and reads served from a shared
+        # 64 MiB mmap instead of read() copies. SQLite drops stale pages itself
+        # when another connection writes.
+        cursor.execute('PRAGMA cache_size=-8192')
+        cursor.execute('PRAGMA mmap_size=67108864')
+        cursor.close()
 
 class User(db.Model):
     """User model for authentication"""
@@ -20,11 +54,20 @@ class User(db.Model):
     
     def set_password(self, password):
         """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
         """Check if provided password matches hash"""
-        return check_password_hash(self.password_hash, password)
+        if not self.password_hash.startswith('$argon2'):
+            return check_password_hash(self.password_hash, password)
+        try:
+            return password_hasher.verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    
+    def password_needs_rehash(self):
+        """Check if the hash predates the current algorithm or parameters"""
+        return password_hash_needs_rehash(self.password_hash)
     
     def to_dict(self):
         """Convert user to dictionary (without password)"""
@@ -40,7 +83,7 @@ class DataItem(db.Model):
     __tablename__ = 'data_items'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=True)
     data_type = db.Column(db.String(50), nullable=True)  # e.g., 'note', 'document', 'json'
@@ -66,7 +109,7 @@ class Credential(db.Model):
     __tablename__ = 'credentials'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     service_name = db.Column(db.String(200), nullable=False)  # e.g., 'GitHub', 'AWS'
     username = db.Column(db.String(200), nullable=True)
     email = db.Column(db.String(200), nullable=True)
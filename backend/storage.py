@@ -1,154 +1,219 @@
 """
-JSON file-based storage system for the Flask API
+SQLite-backed storage system for the Flask API
 """
-import json
 import os
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from functools import lru_cache
 from pathlib import Path
+import orjson
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import db, password_hash_needs_rehash, User, DataItem, Credential
 
 # Data directory
 DATA_DIR = Path(__file__).parent / "data"
 DATA_DIR.mkdir(exist_ok=True)
 
-# JSON file paths
+# Legacy JSON file paths (imported into the database on first run)
 USERS_FILE = DATA_DIR / "users.json"
 DATA_ITEMS_FILE = DATA_DIR / "data_items.json"
 CREDENTIALS_FILE = DATA_DIR / "credentials.json"
 
-# Initialize JSON files if they don't exist
+# Bound once so create/update skip the datetime attribute lookup
+_utcnow = datetime.utcnow
+
+# Initialize database tables
 def init_storage():
-    """Initialize JSON storage files if they don't exist"""
-    if not USERS_FILE.exists():
-        with open(USERS_FILE, 'w') as f:
-            json.dump([], f)
-    if not DATA_ITEMS_FILE.exists():
-        with open(DATA_ITEMS_FILE, 'w') as f:
-            json.dump([], f)
-    if not CREDENTIALS_FILE.exists():
-        with open(CREDENTIALS_FILE, 'w') as f:
-            json.dump([], f)
+    """Create database tables and import any legacy JSON data"""
+    db.create_all()
+    # create_all() skips tables that already exist, so add any newer indexes explicitly
+    for model in (User, DataItem, Credential):
+        for index in model.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+    import_legacy_json()
 
 # Helper functions
 def read_json(file_path):
-    """Read JSON file and return data"""
-    try:
-        with open(file_path, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
+    """Read JSON file and return data; decode errors propagate"""
+    with open(file_path, 'rb') as f:
+        return orjson.loads(f.read())
+
+def import_legacy_json():
+    """Copy records from the old JSON files into the database, then retire the files
+
+    A file that fails to parse raises and is left in place, so startup stops
+    instead of renaming it as migrated with nothing imported.
+    """
+    for file_path, model in ((USERS_FILE, User), (DATA_ITEMS_FILE, DataItem), (CREDENTIALS_FILE, Credential)):
+        if not file_path.exists():
+            continue
+        for record in read_json(file_path):
+            for key in ('created_at', 'updated_at'):
+                if record.get(key):
+                    record[key] = datetime.fromisoformat(record[key])
+            db.session.merge(model(**record))
+        db.session.commit()
+        os.replace(file_path, file_path.with_suffix('.json.migrated'))
+
+# Cached user lookups, so every authenticated request can be served from
+# memory after the first hit. A user row only changes when login upgrades an
+# outdated password hash; each worker's cache may keep the old hash until
+# then, which still verifies the same password (see verify_password).
+# Misses raise instead of returning None so they are never cached.
+# Rows are loaded in a short-lived session of their own, so the cached copy is
+# detached without touching instances the request's session already holds.
+@lru_cache(maxsize=4096)
+def _get_user_by_id(user_id):
+    """Load a user by ID as a detached instance"""
+    with Session(db.engine) as session:
+        user = session.get(User, user_id)
+    if user is None:
+        raise LookupError(user_id)
+    return user
 
-def write_json(file_path, data):
-    """Write data to JSON file"""
-    with open(file_path, 'w') as f:
-        json.dump(data, f, indent=2)
+@lru_cache(maxsize=4096)
+def _get_user_by_username(username):
+    """Load a user by username as a detached instance"""
+    with Session(db.engine) as session:
+        user = session.scalar(db.select(User).filter_by(username=username))
+    if user is None:
+        raise LookupError(username)
+    return user
 
-def get_next_id(items):
-    """Get next available ID from items list"""
-    if not items:
-        return 1
-    return max(item.get('id', 0) for item in items) + 1
+def _attach(user):
+    """Attach a cached user to the current session without hitting the database"""
+    return db.session.merge(user, load=False)
 
 # User operations
 class UserStorage:
     @staticmethod
     def get_all():
         """Get all users"""
-        return read_json(USERS_FILE)
+        return User.query.all()
     
     @staticmethod
     def get_by_id(user_id):
         """Get user by ID"""
-        users = UserStorage.get_all()
-        return next((u for u in users if u.get('id') == user_id), None)
+        try:
+            return _attach(_get_user_by_id(user_id))
+        except LookupError:
+            return None
     
     @staticmethod
     def get_by_username(username):
         """Get user by username"""
-        users = UserStorage.get_all()
-        return next((u for u in users if u.get('username') == username), None)
+        try:
+            return _attach(_get_user_by_username(username))
+        except LookupError:
+            return None
     
     @staticmethod
     def create(username, password):
         """Create a new user"""
-        users = UserStorage.get_all()
+        now = _utcnow()
+        user = User(username=username, created_at=now, updated_at=now)
+        user.set_password(password)
         
-        # Check if username already exists
-        if UserStorage.get_by_username(username):
+        # The unique index on username rejects duplicates in the same INSERT
+        db.session.add(user)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
             raise ValueError("Username already exists")
-        
-        user_id = get_next_id(users)
-        now = datetime.utcnow().isoformat()
-        
-        user = {
-            'id': user_id,
-            'username': username,
-            'password_hash': generate_password_hash(password),
-            'created_at': now,
-            'updated_at': now
-        }
-        
-        users.append(user)
-        write_json(USERS_FILE, users)
         return user
     
     @staticmethod
     def verify_password(user, password):
-        """Verify user password"""
-        return check_password_hash(user.get('password_hash'), password)
+        """Verify user password, upgrading outdated hashes on success"""
+        if not user.check_password(password):
+            return False
+        
+        if user.password_needs_rehash():
+            # The cached copy may be stale: another worker can have upgraded
+            # the hash already, in which case only this worker's cache is refreshed
+            stored_hash = db.session.scalar(
+                db.select(User.password_hash).where(User.id == user.id)
+            )
+            if password_hash_needs_rehash(stored_hash):
+                user.set_password(password)
+                db.session.commit()
+            _get_user_by_id.cache_clear()
+            _get_user_by_username.cache_clear()
+        return True
     
     @staticmethod
     def to_dict(user):
         """Convert user to dictionary (without password)"""
-        return {
-            'id': user.get('id'),
-            'username': user.get('username'),
-            'created_at': user.get('created_at'),
-            'updated_at': user.get('updated_at')
-        }
+        return user.to_dict()
 
 # DataItem operations
 class DataItemStorage:
     @staticmethod
     def get_all(user_id=None):
         """Get all data items, optionally filtered by user_id"""
-        items = read_json(DATA_ITEMS_FILE)
+        query = DataItem.query
         if user_id is not None:
-            return [item for item in items if item.get('user_id') == user_id]
-        return items
+            query = query.filter_by(user_id=user_id)
+        return query.order_by(DataItem.id).all()
+    
+    @staticmethod
+    def get_all_dicts(user_id):
+        """Get a user's data items in API shape without building model instances"""
+        rows = db.session.execute(
+            db.select(
+                DataItem.id,
+                DataItem.user_id,
+                DataItem.title,
+                DataItem.content,
+                DataItem.data_type,
+                DataItem.extra_data.label('metadata'),
+                DataItem.created_at,
+                DataItem.updated_at
+            )
+            .where(DataItem.user_id == user_id)
+            .order_by(DataItem.id)
+        ).mappings()
+        return [dict(row) for row in rows]
+    
+    @staticmethod
+    def get_version(user_id):
+        """Get a fingerprint of a user's data items that changes on every write"""
+        return tuple(
+            db.session.query(db.func.count(DataItem.id), db.func.max(DataItem.updated_at))
+            .filter(DataItem.user_id == user_id)
+            .one()
+        )
     
     @staticmethod
     def get_by_id(item_id, user_id=None):
         """Get data item by ID, optionally filtered by user_id"""
-        items = DataItemStorage.get_all(user_id)
-        return next((item for item in items if item.get('id') == item_id), None)
+        query = DataItem.query.filter_by(id=item_id)
+        if user_id is not None:
+            query = query.filter_by(user_id=user_id)
+        return query.first()
     
     @staticmethod
     def create(user_id, title, content=None, data_type=None, metadata=None):
         """Create a new data item"""
-        items = read_json(DATA_ITEMS_FILE)
-        item_id = get_next_id(items)
-        now = datetime.utcnow().isoformat()
+        now = _utcnow()
+        item = DataItem(
+            user_id=user_id,
+            title=title,
+            content=content,
+            data_type=data_type,
+            extra_data=metadata,
+            created_at=now,
+            updated_at=now
+        )
         
-        item = {
-            'id': item_id,
-            'user_id': user_id,
-            'title': title,
-            'content': content,
-            'data_type': data_type,
-            'extra_data': metadata,
-            'created_at': now,
-            'updated_at': now
-        }
-        
-        items.append(item)
-        write_json(DATA_ITEMS_FILE, items)
+        db.session.add(item)
+        db.session.commit()
         return item
     
     @staticmethod
     def update(item_id, user_id, **kwargs):
         """Update a data item"""
-        items = read_json(DATA_ITEMS_FILE)
         item = DataItemStorage.get_by_id(item_id, user_id)
         
         if not item:
@@ -157,87 +222,102 @@ class DataItemStorage:
         # Update fields
         for key, value in kwargs.items():
             if key == 'metadata':
-                item['extra_data'] = value
+                item.extra_data = value
             elif key in ['title', 'content', 'data_type']:
-                item[key] = value
-        
-        item['updated_at'] = datetime.utcnow().isoformat()
+                setattr(item, key, value)
         
-        # Update in list
-        for i, it in enumerate(items):
-            if it.get('id') == item_id and it.get('user_id') == user_id:
-                items[i] = item
-                break
+        item.updated_at = _utcnow()
         
-        write_json(DATA_ITEMS_FILE, items)
+        db.session.commit()
         return item
     
     @staticmethod
     def delete(item_id, user_id):
-        """Delete a data item"""
-        items = read_json(DATA_ITEMS_FILE)
-        items = [item for item in items if not (item.get('id') == item_id and item.get('user_id') == user_id)]
-        write_json(DATA_ITEMS_FILE, items)
-        return True
+        """Delete a data item, returning whether it existed"""
+        # The row is never loaded into the session, so there is nothing to
+        # reconcile in memory after the DELETE
+        deleted = DataItem.query.filter_by(id=item_id, user_id=user_id).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+        return deleted > 0
     
     @staticmethod
     def to_dict(item):
         """Convert data item to dictionary"""
-        return {
-            'id': item.get('id'),
-            'user_id': item.get('user_id'),
-            'title': item.get('title'),
-            'content': item.get('content'),
-            'data_type': item.get('data_type'),
-            'metadata': item.get('extra_data'),
-            'created_at': item.get('created_at'),
-            'updated_at': item.get('updated_at')
-        }
+        return item.to_dict()
 
 # Credential operations
 class CredentialStorage:
     @staticmethod
     def get_all(user_id=None):
         """Get all credentials, optionally filtered by user_id"""
-        credentials = read_json(CREDENTIALS_FILE)
+        query = Credential.query
         if user_id is not None:
-            return [cred for cred in credentials if cred.get('user_id') == user_id]
-        return credentials
+            query = query.filter_by(user_id=user_id)
+        return query.order_by(Credential.id).all()
+    
+    @staticmethod
+    def get_all_dicts(user_id):
+        """Get a user's credentials in API shape without building model instances"""
+        rows = db.session.execute(
+            db.select(
+                Credential.id,
+                Credential.user_id,
+                Credential.service_name,
+                Credential.username,
+                Credential.email,
+                Credential.encrypted_password,
+                Credential.api_key,
+                Credential.notes,
+                Credential.created_at,
+                Credential.updated_at
+            )
+            .where(Credential.user_id == user_id)
+            .order_by(Credential.id)
+        ).mappings()
+        return [dict(row) for row in rows]
+    
+    @staticmethod
+    def get_version(user_id):
+        """Get a fingerprint of a user's credentials that changes on every write"""
+        return tuple(
+            db.session.query(db.func.count(Credential.id), db.func.max(Credential.updated_at))
+            .filter(Credential.user_id == user_id)
+            .one()
+        )
     
     @staticmethod
     def get_by_id(credential_id, user_id=None):
         """Get credential by ID, optionally filtered by user_id"""
-        credentials = CredentialStorage.get_all(user_id)
-        return next((cred for cred in credentials if cred.get('id') == credential_id), None)
+        query = Credential.query.filter_by(id=credential_id)
+        if user_id is not None:
+            query = query.filter_by(user_id=user_id)
+        return query.first()
     
     @staticmethod
     def create(user_id, service_name, username=None, email=None, password=None, api_key=None, notes=None):
         """Create a new credential"""
-        credentials = read_json(CREDENTIALS_FILE)
-        credential_id = get_next_id(credentials)
-        now = datetime.utcnow().isoformat()
-        
-        credential = {
-            'id': credential_id,
-            'user_id': user_id,
-            'service_name': service_name,
-            'username': username,
-            'email': email,
-            'encrypted_password': password,  # In production, encrypt this
-            'api_key': api_key,  # In production, encrypt this
-            'notes': notes,
-            'created_at': now,
-            'updated_at': now
-        }
+        now = _utcnow()
+        credential = Credential(
+            user_id=user_id,
+            service_name=service_name,
+            username=username,
+            email=email,
+            encrypted_password=password,  # In production, encrypt this
+            api_key=api_key,  # In production, encrypt this
+            notes=notes,
+            created_at=now,
+            updated_at=now
+        )
         
-        credentials.append(credential)
-        write_json(CREDENTIALS_FILE, credentials)
+        db.session.add(credential)
+        db.session.commit()
         return credential
     
     @staticmethod
     def update(credential_id, user_id, **kwargs):
         """Update a credential"""
-        credentials = read_json(CREDENTIALS_FILE)
         credential = CredentialStorage.get_by_id(credential_id, user_id)
         
         if not credential:
@@ -246,44 +326,25 @@ class CredentialStorage:
         # Update fields
         for key, value in kwargs.items():
             if key == 'password':
-                credential['encrypted_password'] = value
+                credential.encrypted_password = value
             elif key in ['service_name', 'username', 'email', 'api_key', 'notes']:
-                credential[key] = value
+                setattr(credential, key, value)
         
-        credential['updated_at'] = datetime.utcnow().isoformat()
+        credential.updated_at = _utcnow()
         
-        # Update in list
-        for i, cred in enumerate(credentials):
-            if cred.get('id') == credential_id and cred.get('user_id') == user_id:
-                credentials[i] = credential
-                break
-        
-        write_json(CREDENTIALS_FILE, credentials)
+        db.session.commit()
         return credential
     
     @staticmethod
     def delete(credential_id, user_id):
-        """Delete a credential"""
-        credentials = read_json(CREDENTIALS_FILE)
-        credentials = [cred for cred in credentials if not (cred.get('id') == credential_id and cred.get('user_id') == user_id)]
-        write_json(CREDENTIALS_FILE, credentials)
-        return True
+        """Delete a credential, returning whether it existed"""
+        deleted = Credential.query.filter_by(id=credential_id, user_id=user_id).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+        return deleted > 0
     
     @staticmethod
     def to_dict(credential):
         """Convert credential to dictionary"""
-        return {
-            'id': credential.get('id'),
-            'user_id': credential.get('user_id'),
-            'service_name': credential.get('service_name'),
-            'username': credential.get('username'),
-            'email': credential.get('email'),
-            'encrypted_password': credential.get('encrypted_password'),
-            'api_key': credential.get('api_key'),
-            'notes': credential.get('notes'),
-            'created_at': credential.get('created_at'),
-            'updated_at': credential.get('updated_at')
-        }
-
-# Initialize storage on import
-init_storage()
+        return credential.to_dict()
@@ -0,0 +1,12 @@
+"""
+WSGI entry point for production servers
+
+    gunicorn --config gunicorn.conf.py wsgi:app
+
+gunicorn.conf.py runs gthread workers: several processes, each serving
+requests on a small thread pool. app.run() in app.py is only for local
+development.
+"""
+from app import app
+
+__all__ = ['app']